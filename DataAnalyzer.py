@@ -1,164 +1,446 @@
+import concurrent.futures
+import csv
+import functools
+import multiprocessing
+import os
+import sys
+
 import streamlit as st
+import numpy as np
 import pandas as pd
-from io import BytesIO
+import pyarrow as pa
+from io import BytesIO, StringIO
 
 # --------------------------
 # Fonctions de parsing générique
 # --------------------------
-def parse_full_hl7(hl7_message):
+# csv.reader plafonne les champs à 128 Ko et lève csv.Error au-delà ; un OBX
+# avec document embarqué en base64 dépasse largement cette limite. La limite
+# est un C long : sys.maxsize déborde sur Windows 64 bits (LLP64), d'où le
+# repli sur 2**31 - 1.
+try:
+    csv.field_size_limit(sys.maxsize)
+except OverflowError:
+    csv.field_size_limit(2**31 - 1)
+
+def _tokenize(hl7_message: str) -> list[list[str]]:
     """
-    Parse complet du message HL7 en séparant chaque ligne par le délimiteur "|".
-    Retourne un DataFrame où chaque ligne du message correspond à une ligne du tableau.
+    Découpe le message HL7 en une liste de champs par segment via csv.reader :
+    le balayage par caractère et l'allocation des lignes se font dans le module
+    _csv en C, au lieu d'une boucle Python par jeton.
+    """
+    msg = hl7_message.replace("\r\n", "\n").replace("\r", "\n").strip()
+    if not msg:
+        return []
+    reader = csv.reader(StringIO(msg), delimiter="|", quoting=csv.QUOTE_NONE)
+    # csv.reader rend [] pour une ligne vide ; splitlines donnait [""]
+    return [row or [""] for row in reader]
+
+def _tokenize_bytes(raw: bytes) -> list[list[bytes]]:
+    """
+    Découpe un message HL7 brut (bytes) en une liste de champs bytes par segment,
+    sans décodage préalable du fichier complet. Les délimiteurs HL7 étant ASCII,
+    les fins de segment sont localisées en une comparaison numpy vectorisée sur
+    les octets, puis chaque ligne est tranchée directement dans le tampon ;
+    seuls les champs réellement utilisés sont décodés, via _decode_field.
     """
+    msg = raw.replace(b"\r\n", b"\n").replace(b"\r", b"\n").strip()
+    if not msg:
+        return []
+    arr = np.frombuffer(msg, dtype=np.uint8)
+    newlines = np.flatnonzero(arr == 10)
     rows = []
-    lines = hl7_message.strip().splitlines()
-    for line in lines:
-        fields = line.split("|")
-        rows.append(fields)
-    max_fields = max(len(row) for row in rows)
-    for row in rows:
-        if len(row) < max_fields:
-            row.extend([""] * (max_fields - len(row)))
+    prev = 0
+    for end in newlines:
+        rows.append(msg[prev:end].split(b"|"))
+        prev = end + 1
+    rows.append(msg[prev:].split(b"|"))
+    return rows
+
+def _decode_field(field: bytes) -> str:
+    """
+    Décode un champ isolé au moment où il est utilisé (UTF-8, repli latin-1).
+    """
+    try:
+        return field.decode("utf-8")
+    except UnicodeDecodeError:
+        return field.decode("latin-1")
+
+def _rstrip_last(c: list[bytes]) -> list[bytes]:
+    """
+    Rejoue côté détails le ligne.strip() des parseurs d'origine : après
+    découpage, les blancs de fin de ligne appartiennent au dernier champ.
+    La ligne d'origine reste intacte pour le parsing complet.
+    """
+    last = c[-1].rstrip()
+    if last != c[-1]:
+        c = c[:-1] + [last]
+    return c
+
+def _nth_caret(s: str, n: int) -> str | None:
+    """
+    Retourne le n-ième sous-champ '^' (base 0) de s, ou None s'il n'existe pas,
+    par un simple balayage str.find : aucune liste intermédiaire n'est allouée
+    contrairement à split('^') qui matérialise tous les sous-champs.
+    """
+    i = 0
+    for _ in range(n):
+        j = s.find('^', i)
+        if j < 0:
+            return None
+        i = j + 1
+    k = s.find('^', i)
+    return s[i:k] if k >= 0 else s[i:]
+
+def _compile_detail_parser(spec, keys):
+    """
+    Génère à l'import un parseur de détails spécialisé à partir d'une table
+    de spécification "segment -> extractions". Les cas simples sont déroulés
+    en code linéaire (pas de dispatch ni d'appel par champ) ; les segments à
+    logique particulière délèguent à leur handler dédié.
+    """
+    src = [
+        "def _parser(rows):",
+        "    data = {}",
+        "    for c in rows:",
+        # Équivalent du ligne.strip() d'origine : le code segment perd ses
+        # blancs de tête (des deux côtés si la ligne n'a qu'un champ).
+        "        seg = c[0].lstrip() if len(c) > 1 else c[0].strip()",
+    ]
+    namespace = {
+        "_decode_field": _decode_field,
+        "_nth_caret": _nth_caret,
+        "_rstrip_last": _rstrip_last,
+        "_keys": frozenset(keys),
+    }
+    kw = "if"
+    for segment, entries in spec:
+        src.append(f"        {kw} seg == {segment.encode('ascii')!r}:")
+        kw = "elif"
+        src.append("            c = _rstrip_last(c)")
+        for entry in entries:
+            kind = entry[0]
+            if kind == "field":
+                _, idx, key = entry
+                src.append(f"            if len(c) > {idx}:")
+                src.append(f"                data[{key!r}] = _decode_field(c[{idx}])")
+            elif kind == "caret0":
+                _, idx, key = entry
+                src.append(f"            if len(c) > {idx}:")
+                src.append(f"                data[{key!r}] = _nth_caret(_decode_field(c[{idx}]), 0)")
+            elif kind == "date8":
+                _, idx, key = entry
+                src.append(f"            if len(c) > {idx}:")
+                src.append(f"                v = _decode_field(c[{idx}])")
+                src.append("                if len(v) >= 8:")
+                src.append(f"                    data[{key!r}] = v[:8]")
+            elif kind == "caret_date8":
+                _, idx, n, key = entry
+                src.append(f"            if len(c) > {idx}:")
+                src.append(f"                v = _nth_caret(_decode_field(c[{idx}]), {n})")
+                src.append("                if v is not None and len(v) >= 8:")
+                src.append(f"                    data[{key!r}] = v[:8]")
+            else:  # "custom"
+                _, fn = entry
+                namespace[fn] = globals()[fn]
+                src.append(f"            {fn}(c, data)")
+        # L'early-exit ne vaut la peine qu'après un segment traité
+    src.append("        else:")
+    src.append("            continue")
+    src.append("        if _keys.issubset(data):")
+    src.append("            break")
+    src.append("    return data")
+    exec("\n".join(src), namespace)
+    return namespace["_parser"]
+
+def _rows_to_df(rows: list[list[str]]) -> pd.DataFrame:
+    """
+    Transforme les segments déjà découpés en DataFrame, en complétant
+    chaque ligne jusqu'au nombre maximal de champs.
+    """
+    lens = np.fromiter(map(len, rows), dtype=np.int32, count=len(rows))
+    max_fields = int(lens.max())
+    # Une seule allocation pour toute la matrice au lieu d'une liste par ligne
+    arr = np.empty((len(rows), max_fields), dtype=object)
+    arr.fill("")
+    for i, row in enumerate(rows):
+        arr[i, :lens[i]] = row
     col_names = [f"Field {i+1}" for i in range(max_fields)]
-    return pd.DataFrame(rows, columns=col_names)
+    return pd.DataFrame(arr, columns=col_names, copy=False)
+
+@st.cache_data(max_entries=64)
+def parse_full_hl7(hl7_message: str) -> pd.DataFrame:
+    """
+    Parse complet du message HL7 en séparant chaque ligne par le délimiteur "|".
+    Retourne un DataFrame où chaque ligne du message correspond à une ligne du tableau.
+    Le résultat est mis en cache par message pour les rafraîchissements Streamlit.
+    """
+    return _rows_to_df(_tokenize(hl7_message))
 
 # --------------------------
 # Parsing pour ORLine
 # --------------------------
-def parse_details_hl7_orline(hl7_message):
+# Clés extraites par chaque parseur : dès qu'elles sont toutes présentes,
+# inutile de balayer le reste du message.
+_ORLINE_KEYS = {
+    "ID PAT",
+    "Admission Entree",
+    "ID Sejour",
+    "ID Operation",
+    "Dat Operation",
+    "Cod Service Entree",
+    "Service Entree",
+    "Type d'hospitalisation",
+}
+_WISH_KEYS = {"Date Message", "Heure Message", "ID PAT", "Date Naissance", "Sexe"}
+
+# Schéma des colonnes du tableau de détails, par source : permet de construire
+# le DataFrame colonne par colonne sans inférence ligne à ligne de pandas.
+_DETAIL_COLUMNS = {
+    "ORLine": (
+        "ID PAT",
+        "Admission Entree",
+        "ID Sejour",
+        "ID Operation",
+        "Dat Operation",
+        "Cod Service Entree",
+        "Service Entree",
+        "Type d'hospitalisation",
+    ),
+    "WISH": ("Date Message", "Heure Message", "ID PAT", "Date Naissance", "Sexe"),
+}
+
+def _h_orline_obx(champs: list[bytes], data: dict[str, str]) -> None:
+    if len(champs) > 1 and champs[1] == b"2":
+        if len(champs) > 5:
+            data["Cod Service Entree"] = _decode_field(champs[5])
+
+def _h_orline_ail(champs: list[bytes], data: dict[str, str]) -> None:
+    if len(champs) > 3:
+        champ_ail = _decode_field(champs[3])
+        # Balayage par str.find : aucune des sous-chaînes jetées par les
+        # anciens split(".")/split("^^^")/split("^") n'est allouée.
+        dot = champ_ail.find(".")
+        if dot >= 0:
+            sep = champ_ail.find("^^^", dot + 1)
+            if sep >= 0:
+                data["Cod Service Entree"] = champ_ail[dot + 1:sep].strip()
+                fin = champ_ail.find("^", sep + 3)
+                base_service = champ_ail[sep + 3:fin] if fin >= 0 else champ_ail[sep + 3:]
+                data["Service Entree"] = "^^^" + base_service.strip()
+            else:
+                data["Cod Service Entree"] = champ_ail[dot + 1:].strip()
+                data["Service Entree"] = ""
+        else:
+            data["Cod Service Entree"] = champ_ail
+            data["Service Entree"] = ""
+
+def _h_orline_pv2(champs: list[bytes], data: dict[str, str]) -> None:
+    if "Type d'hospitalisation" not in data:
+        data["Type d'hospitalisation"] = "(Donnée correcte extraite de PV1-2)"
+
+# Spécification "segment -> champ -> clé" du parseur ORLine ; les dates sont
+# extraites brutes (AAAAMMJJ) et reformatées ensuite par _format_detail_dates.
+_ORLINE_SPEC = [
+    ("PID", [("field", 2, "ID PAT")]),
+    ("PV1", [("field", 2, "Admission Entree"), ("field", 18, "ID Sejour")]),
+    ("SCH", [("caret0", 1, "ID Operation"), ("caret_date8", 11, 3, "Dat Operation")]),
+    ("OBX", [("custom", "_h_orline_obx")]),
+    ("AIL", [("custom", "_h_orline_ail")]),
+    ("PV2", [("custom", "_h_orline_pv2")]),
+]
+
+_PARSER_ORLINE = _compile_detail_parser(_ORLINE_SPEC, _ORLINE_KEYS)
+
+def parse_details_hl7_orline(rows: list[list[bytes]]) -> dict[str, str]:
     """
     Extrait les détails spécifiques du message HL7 pour ORLine et retourne un dictionnaire.
+    Reçoit les segments bytes déjà découpés par _tokenize_bytes.
     """
-    data = {}
-    lignes = hl7_message.strip().splitlines()
-    
-    for ligne in lignes:
-        champs = ligne.strip().split("|")
-        segment = champs[0]
-        
-        if segment == "PID":
-            if len(champs) > 2:
-                data["ID PAT"] = champs[2]
-                
-        elif segment == "PV1":
-            if len(champs) > 2:
-                data["Admission Entree"] = champs[2]
-            if len(champs) > 18:
-                data["ID Sejour"] = champs[18]
-                
-        elif segment == "SCH":
-            if len(champs) > 1:
-                data["ID Operation"] = champs[1].split('^')[0]
-            if len(champs) > 11:
-                sous_champs = champs[11].split('^')
-                if len(sous_champs) > 3:
-                    dt = sous_champs[3]
-                    if len(dt) >= 8:
-                        date_str = dt[:8]
-                        formatted_date = date_str[6:8] + "/" + date_str[4:6] + "/" + date_str[0:4]
-                        data["Dat Operation"] = formatted_date
-                        
-        elif segment == "OBX":
-            if len(champs) > 1 and champs[1] == "2":
-                if len(champs) > 5:
-                    data["Cod Service Entree"] = champs[5]
-                    
-        elif segment == "AIL":
-            if len(champs) > 3:
-                champ_ail = champs[3]
-                if "." in champ_ail:
-                    splitted_dot = champ_ail.split(".", 1)
-                    ail_after_dot = splitted_dot[1] if len(splitted_dot) > 1 else ""
-                    splitted_caret = ail_after_dot.split("^^^", 1)
-                    data["Cod Service Entree"] = splitted_caret[0].strip()
-                    if len(splitted_caret) > 1:
-                        base_service = splitted_caret[1].split("^")[0].strip()
-                        data["Service Entree"] = "^^^" + base_service
-                    else:
-                        data["Service Entree"] = ""
-                else:
-                    data["Cod Service Entree"] = champ_ail
-                    data["Service Entree"] = ""
-                    
-        elif segment == "PV2":
-            if "Type d'hospitalisation" not in data:
-                data["Type d'hospitalisation"] = "(Donnée correcte extraite de PV1-2)"
-                
-    return data
+    return _PARSER_ORLINE(rows)
 
 # --------------------------
 # Parsing pour WISH
 # --------------------------
-def parse_details_hl7_wish(hl7_message):
+def _h_wish_msh(champs: list[bytes], data: dict[str, str]) -> None:
+    if len(champs) > 6:
+        dt_str = _decode_field(champs[6])
+        if len(dt_str) >= 8:
+            # Valeur brute AAAAMMJJ[HHMM] pour les deux colonnes ; le
+            # reformatage est vectorisé après coup par _format_detail_dates.
+            data["Date Message"] = dt_str
+            data["Heure Message"] = dt_str
+
+_WISH_SPEC = [
+    ("MSH", [("custom", "_h_wish_msh")]),
+    ("PID", [
+        ("field", 3, "ID PAT"),
+        ("date8", 7, "Date Naissance"),
+        ("field", 8, "Sexe"),
+    ]),
+]
+
+_PARSER_WISH = _compile_detail_parser(_WISH_SPEC, _WISH_KEYS)
+
+def parse_details_hl7_wish(rows: list[list[bytes]]) -> dict[str, str]:
     """
     Extrait les détails spécifiques du message HL7 pour WISH et retourne un dictionnaire.
-    
+    Reçoit les segments bytes déjà découpés par _tokenize_bytes.
+
     - ID PAT : PID Field 4 (index 3)
     - Date de naissance : PID Field 8 (index 7), format jj/mm/aaaa
     - Sexe : PID Field 9 (index 8)
     - Date Message : MSH Field 7 (index 6), format jj/mm/aaaa
     - Heure Message : MSH Field 7 (index 6), format hh:mm
     """
-    data = {}
-    lignes = hl7_message.strip().splitlines()
-    
-    for ligne in lignes:
-        champs = ligne.strip().split("|")
-        segment = champs[0]
-        
-        if segment == "MSH":
-            if len(champs) > 6:
-                dt_str = champs[6]
-                if len(dt_str) >= 8:
-                    annee = dt_str[0:4]
-                    mois  = dt_str[4:6]
-                    jour  = dt_str[6:8]
-                    data["Date Message"] = f"{jour}/{mois}/{annee}"
-                    if len(dt_str) >= 12:
-                        heure = dt_str[8:10]
-                        minute = dt_str[10:12]
-                        data["Heure Message"] = f"{heure}:{minute}"
-                    else:
-                        data["Heure Message"] = ""
-        
-        elif segment == "PID":
-            if len(champs) > 3:
-                data["ID PAT"] = champs[3]
-            if len(champs) > 7:
-                dob_str = champs[7]
-                if len(dob_str) >= 8:
-                    annee = dob_str[0:4]
-                    mois  = dob_str[4:6]
-                    jour  = dob_str[6:8]
-                    data["Date Naissance"] = f"{jour}/{mois}/{annee}"
-            if len(champs) > 8:
-                data["Sexe"] = champs[8]
-                
-    return data
+    return _PARSER_WISH(rows)
 
 # --------------------------
 # Sélection dynamique du parseur
 # --------------------------
-def parse_details_hl7_dynamic(hl7_message, source):
+def parse_details_hl7_dynamic(rows: list[list[bytes]], source: str) -> dict[str, str]:
     if source == "ORLine":
-        return parse_details_hl7_orline(hl7_message)
+        return parse_details_hl7_orline(rows)
     elif source == "WISH":
-        return parse_details_hl7_wish(hl7_message)
+        return parse_details_hl7_wish(rows)
     else:
         return {}
 
-def to_excel(df):
+def _jjmmaaaa(s: pd.Series) -> pd.Series:
+    """Reformate une colonne AAAAMMJJ... en jj/mm/aaaa par tranches vectorisées."""
+    return s.str[6:8] + "/" + s.str[4:6] + "/" + s.str[0:4]
+
+def _format_detail_dates(details_df: pd.DataFrame, source: str) -> None:
+    """
+    Reformate en place les horodatages HL7 bruts (AAAAMMJJ[HHMM]) extraits par
+    les parseurs de détails : une opération pandas par colonne au lieu d'une
+    concaténation Python par segment et par fichier.
+    """
+    if source == "WISH":
+        raw = details_df["Date Message"]
+        details_df["Date Message"] = _jjmmaaaa(raw)
+        heure = details_df["Heure Message"]
+        details_df["Heure Message"] = (
+            (heure.str[8:10] + ":" + heure.str[10:12])
+            .where(heure.str.len() >= 12, "")
+            .mask(heure.isna())
+        )
+        details_df["Date Naissance"] = _jjmmaaaa(details_df["Date Naissance"])
+    elif source == "ORLine":
+        details_df["Dat Operation"] = _jjmmaaaa(details_df["Dat Operation"])
+
+# Taille de tranche pour la lecture en flux, et taille de fichier au-delà de
+# laquelle on évite de matérialiser tout l'upload d'un bloc via getvalue().
+_STREAM_CHUNK = 1 << 20
+_STREAM_THRESHOLD = 8 * _STREAM_CHUNK
+
+def _iter_segments(up_file, chunk: int = _STREAM_CHUNK):
+    """
+    Lit un fichier uploadé par tranches alignées sur les fins de segment et
+    yield une ligne bytes à la fois, sans matérialiser le fichier entier.
+    Le tampon se limite à la tranche courante plus la ligne en cours.
+    """
+    buf = b""
+    pending_cr = False
+    while True:
+        data = up_file.read(chunk)
+        if not data:
+            if buf:
+                yield buf
+            return
+        if pending_cr:
+            data = b"\r" + data
+            pending_cr = False
+        if data.endswith(b"\r"):
+            # Un \r final peut ouvrir un \r\n coupé par la tranche suivante
+            data = data[:-1]
+            pending_cr = True
+        buf += data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        nl = buf.rfind(b"\n")
+        if nl < 0:
+            continue
+        for line in buf[:nl].split(b"\n"):
+            yield line
+        buf = buf[nl + 1:]
+
+def _parse_stream(name: str, up_file, source: str) -> tuple[str, list[list[bytes]], dict[str, str]]:
+    """
+    Variante en flux de _parse_one pour les gros fichiers : la mémoire de
+    lecture est bornée par la tranche au lieu de la taille du fichier.
+    """
+    rows = [line.split(b"|") for line in _iter_segments(up_file)]
+    # Même résultat que le strip() global de _tokenize_bytes
+    while rows and len(rows[0]) == 1 and not rows[0][0].strip():
+        del rows[0]
+    while rows and len(rows[-1]) == 1 and not rows[-1][0].strip():
+        del rows[-1]
+    return name, rows, parse_details_hl7_dynamic(rows, source)
+
+@functools.lru_cache(maxsize=256)
+def _parse_cached(file_bytes: bytes, source: str) -> tuple[list[list[bytes]], dict[str, str]]:
+    """
+    Parse mémoïsé par contenu : un même message HL7 uploadé deux fois
+    (ou re-traité lors d'un rerun) n'est découpé qu'une seule fois.
+    Les bytes étant hachables, le contenu sert directement de clé.
+    """
+    rows = _tokenize_bytes(file_bytes)
+    return rows, parse_details_hl7_dynamic(rows, source)
+
+def _parse_one(name: str, file_bytes: bytes, source: str) -> tuple[str, list[list[bytes]], dict[str, str]]:
+    """
+    Travailleur de haut niveau (utilisable par un pool de processus) :
+    parse un fichier HL7 au niveau bytes et retourne (nom, segments découpés, détails).
+    Aucun décodage du fichier complet : les champs sont décodés à l'utilisation.
+    """
+    rows, details = _parse_cached(file_bytes, source)
+    # Copie : l'appelant annote le dictionnaire (Fichier, Source HL7) alors
+    # que l'original reste dans le cache.
+    return name, rows, dict(details)
+
+@st.cache_data(
+    max_entries=64,
+    hash_funcs={pd.DataFrame: lambda df: pd.util.hash_pandas_object(df, index=True).values.tobytes()},
+)
+def to_excel(df: pd.DataFrame) -> bytes:
     """
     Convertit un DataFrame en fichier Excel et retourne les bytes.
+    Mis en cache : changer de patient dans la selectbox ne resérialise pas l'Excel.
     """
     output = BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+    # La détection d'URL/formules (un scan regex par cellule) est inutile pour
+    # des champs HL7 bruts. Pas de constant_memory ici : pandas émet les
+    # cellules colonne par colonne et ce mode jette toute écriture dans une
+    # ligne déjà vidée, ce qui tronquerait silencieusement le classeur.
+    with pd.ExcelWriter(
+        output,
+        engine="xlsxwriter",
+        engine_kwargs={
+            "options": {
+                "strings_to_formulas": False,
+                "strings_to_urls": False,
+            }
+        },
+    ) as writer:
         df.to_excel(writer, index=False, sheet_name="Parsed HL7")
     return output.getvalue()
 
 # --------------------------
 # Interface principale
 # --------------------------
+@st.fragment
+def _render_patient_panel(details_df: pd.DataFrame, patient_ids: list, pat_index: dict) -> None:
+    """
+    Panneau de sélection patient isolé dans un fragment Streamlit : changer
+    d'ID ne relance que ce bloc, pas le parsing ni la sérialisation Excel.
+    L'index patient est calculé en amont dans main() : le corps du fragment
+    se réduit à la selectbox et au lookup O(1) + iloc.
+    """
+    selected_patient = st.selectbox("📌 Sélectionnez un ID PATIENT pour afficher ses détails", options=patient_ids)
+    if selected_patient:
+        patient_details = details_df.iloc[pat_index[selected_patient]]
+        st.subheader(f"📋 Détails pour le patient {selected_patient}")
+        st.dataframe(patient_details)
+
 def main():
     st.title("📂 HL7 Data Analyzer - WISH & ORLine")
     
@@ -177,28 +459,69 @@ def main():
     
     if uploaded_files:
         details_list = []
-        full_parsed_list = []
-        
-        for uploaded_file in uploaded_files:
-            file_bytes = uploaded_file.getvalue()
-            try:
-                hl7_message = file_bytes.decode("utf-8")
-            except UnicodeDecodeError:
-                hl7_message = file_bytes.decode("latin-1")
-            
-            # Parsing complet
-            df_full = parse_full_hl7(hl7_message)
-            df_full["Fichier"] = uploaded_file.name
-            full_parsed_list.append(df_full)
-            
+        all_rows = []
+        all_filenames = []
+
+        # Streamlit exécute ce script comme __main__, donc _parse_one se pickle
+        # en __main__._parse_one : seul le démarrage par fork permet aux workers
+        # de le résoudre (spawn/forkserver réimporteraient le module sans le
+        # retrouver). Sans fork disponible, on reste sur le chemin série.
+        if len(uploaded_files) > 2 and "fork" in multiprocessing.get_all_start_methods():
+            # Les fichiers sont indépendants : un fichier par cœur.
+            results = [None] * len(uploaded_files)
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=os.cpu_count(),
+                mp_context=multiprocessing.get_context("fork"),
+            ) as executor:
+                futures = {
+                    executor.submit(_parse_one, f.name, f.getvalue(), source_choice): i
+                    for i, f in enumerate(uploaded_files)
+                }
+                for future in concurrent.futures.as_completed(futures):
+                    results[futures[future]] = future.result()
+        else:
+            # Le démarrage du pool coûterait plus cher que quelques fichiers en
+            # série ; les gros fichiers sont lus par tranches plutôt que
+            # matérialisés d'un bloc.
+            results = []
+            for f in uploaded_files:
+                if getattr(f, "size", 0) > _STREAM_THRESHOLD:
+                    f.seek(0)
+                    results.append(_parse_stream(f.name, f, source_choice))
+                else:
+                    results.append(_parse_one(f.name, f.getvalue(), source_choice))
+
+        for name, rows, details in results:
+            # Parsing complet : accumulation des segments bruts de tous les fichiers
+            all_rows.extend(rows)
+            all_filenames.extend([name] * len(rows))
+
             # Extraction des détails selon la source choisie
-            details = parse_details_hl7_dynamic(hl7_message, source_choice)
-            details["Fichier"] = uploaded_file.name
+            details["Fichier"] = name
             details["Source HL7"] = source_choice
             details_list.append(details)
-        
-        if full_parsed_list:
-            df_full_combined = pd.concat(full_parsed_list, ignore_index=True, sort=False)
+
+        if all_rows:
+            # Une seule table Arrow pour tous les fichiers : pas de DataFrame
+            # intermédiaire par fichier ni de recopie par pd.concat. La largeur
+            # maximale est calculée sur l'ensemble des fichiers et les segments
+            # sont versés dans une matrice unique déjà alignée, sans listes de
+            # remplissage par ligne.
+            max_fields = max(len(row) for row in all_rows)
+            arr = np.empty((len(all_rows), max_fields), dtype=object)
+            arr.fill(b"")
+            for i, row in enumerate(all_rows):
+                arr[i, :len(row)] = row
+            table = pa.table(
+                {
+                    f"Field {i+1}": pa.array(
+                        [_decode_field(f) for f in arr[:, i]], type=pa.string()
+                    )
+                    for i in range(max_fields)
+                }
+                | {"Fichier": pa.array(all_filenames)}
+            )
+            df_full_combined = table.to_pandas(types_mapper=pd.ArrowDtype)
             st.subheader("📄 Messages HL7 parsés")
             st.dataframe(df_full_combined)
             
@@ -210,14 +533,20 @@ def main():
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
             )
         
-        details_df = pd.DataFrame(details_list)
-        if "ID PAT" in details_df.columns:
+        # Construction colonne par colonne sur un schéma connu : pandas n'a
+        # plus à fusionner les clés ni à inférer les dtypes ligne par ligne.
+        detail_keys = _DETAIL_COLUMNS.get(source_choice, ()) + ("Fichier", "Source HL7")
+        details_df = pd.DataFrame(
+            {k: [d.get(k) for d in details_list] for k in detail_keys},
+            copy=False,
+        )
+        _format_detail_dates(details_df, source_choice)
+        if "ID PAT" in details_df.columns and details_df["ID PAT"].notna().any():
             patient_ids = details_df["ID PAT"].dropna().unique().tolist()
-            selected_patient = st.selectbox("📌 Sélectionnez un ID PATIENT pour afficher ses détails", options=patient_ids)
-            if selected_patient:
-                patient_details = details_df[details_df["ID PAT"] == selected_patient]
-                st.subheader(f"📋 Détails pour le patient {selected_patient}")
-                st.dataframe(patient_details)
+            # Index ID PAT -> positions de lignes, calculé une fois : la sélection
+            # devient un lookup dict + iloc au lieu d'un masque booléen complet.
+            pat_index = details_df.groupby("ID PAT", sort=False).indices
+            _render_patient_panel(details_df, patient_ids, pat_index)
         else:
             st.warning("❌ Aucun ID PAT trouvé dans les fichiers HL7 uploadés.")
 